@@ -8,16 +8,30 @@ and generates detailed descriptions using Gemini 2.5 Flash via Vertex AI.
 
 import argparse
 import asyncio
+import base64
 import csv
+import functools
+import hashlib
+import io
+import json
+import math
+import random
 import re
+import time
 from dataclasses import dataclass
+from datetime import timedelta
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
+import google.auth
+import google.auth.transport.requests
 import vertexai
+from google.api_core import exceptions as gapi_exceptions
 from dotenv import load_dotenv
-from vertexai.generative_models import GenerativeModel, Image
+from vertexai.caching import CachedContent
+from vertexai.generative_models import GenerativeModel, Part
 from playwright.async_api import async_playwright
+from PIL import Image as PILImage
 
 # Load environment variables from .env file
 load_dotenv()
@@ -31,7 +45,41 @@ LOOKER_STUDIO_URL = os.getenv("LOOKER_STUDIO_URL", "https://lookerstudio.google.
 
 AUTH_STATE_FILE = "auth_state.json"
 OUTPUT_DIR = "output"
+CACHE_DIR = Path(OUTPUT_DIR) / ".cache"
+BROWSER_CACHE_DIR = ".pw-cache"  # Chromium disk cache, persists across runs
 DEFAULT_TIMEOUT = 60000  # 60 seconds for page loads
+MAX_HTML_CHARS = 50000  # HTML transport cap per page over the CDP wire
+MAX_HTML_TOKENS = 8000  # HTML budget per report in the Gemini prompt
+SCREENSHOT_QUALITY = 80  # JPEG quality for captured screenshots
+SCREENSHOT_MAX_SIZE = (2048, 8192)  # max width/height before downscaling
+MOSAIC_WIDTH = 2048  # total width of the tiled multi-page mosaic
+MOSAIC_MIN_PAGES = 3  # tile screenshots into one image from this page count up
+
+# Third-party requests that slow navigation (and can hold off page readiness)
+# without contributing anything to the captured dashboard
+BLOCKED_URL_PARTS = (
+    "doubleclick.",
+    "google-analytics.",
+    "googletagmanager.",
+    "hotjar.",
+    "sentry.io",
+    ".woff",
+    ".woff2",
+)
+
+# Transient Vertex errors worth retrying instead of discarding the report
+RETRYABLE_VERTEX_ERRORS = (
+    gapi_exceptions.ResourceExhausted,
+    gapi_exceptions.ServiceUnavailable,
+    gapi_exceptions.DeadlineExceeded,
+)
+MAX_GEMINI_TRIES = 5
+MAX_GOTO_TRIES = 3
+DEFAULT_CONCURRENCY = 8  # concurrent browser contexts
+GEMINI_MODEL_NAME = "gemini-2.5-flash-preview-05-20"
+CACHE_TTL = timedelta(hours=1)  # lifetime of the Vertex context cache
+DESCRIBE_WORKERS = 4  # concurrent Gemini description workers
+DESCRIBE_QUEUE_SIZE = 4  # captured reports buffered ahead of Gemini
 
 
 @dataclass
@@ -44,28 +92,82 @@ class PageCapture:
     html_content: str
 
 
-GEMINI_PROMPT_SINGLE = """You are analyzing a Looker Studio dashboard/report. Based on the provided information, write a detailed description of this report.
+# Static instructions shared by every call. Kept separate from the per-report
+# templates so they can be registered once as a Vertex context cache instead of
+# being resent (and billed at full rate) on every request. Note: explicit
+# context caching has a ~1024-token minimum on Gemini 2.5 Flash, so this
+# preamble must stay comfortably above that or create_model() will fall back
+# to the uncached path.
+GEMINI_SYSTEM_INSTRUCTION = """You are an expert analyst documenting Looker Studio dashboards/reports. For each request you will receive the report name, a short initial description written by the report owner, the cleaned body HTML of each page, and a full-page screenshot of each page. Based on that information, write a detailed description of the report suitable for an internal documentation catalog.
 
-**Report Name:** {name}
+## How to read the inputs
+
+- **Report name and initial description:** Treat these as hints about intent, not as ground truth. If the visible content contradicts the initial description, describe what you actually see and note the discrepancy briefly.
+- **Page HTML:** This is the report body with scripts, styles, and heavy payload attributes stripped, and it may be truncated. Use it to recover exact label text, metric names, column headers, filter captions, and dropdown options that are too small or blurry to read in the screenshot. Ignore structural noise such as wrapper divs, ARIA scaffolding, class-name hashes, and layout containers - they are artifacts of the Looker Studio renderer, not report content.
+- **Screenshots:** Use these for layout, visual hierarchy, chart types, colors used to encode meaning, and the overall reading order. When the HTML and the screenshot disagree (for example, a chart that rendered after the HTML snapshot), prefer the screenshot for visual facts and the HTML for exact text.
+- If a screenshot legend describes a tiled layout, the single image contains several report pages arranged in a grid; use the legend to attribute content to the correct page and never describe the mosaic itself as a feature of the report.
+
+## What the description must cover
+
+1. **Purpose and main function.** Open with one or two sentences stating what the report is for and what question it answers. Infer the business domain (sales, marketing, finance, operations, product analytics, support, etc.) from the metric names and dimensions rather than guessing from the report title alone.
+2. **Key metrics, KPIs, and data points.** Name the specific metrics shown (e.g. "Sessions", "Conversion rate", "MRR", "Ticket backlog"), including units and aggregation level where visible. Call out scorecards/single-value tiles separately from charted series. If targets, comparisons, or period-over-period deltas are displayed, say so and name the comparison period.
+3. **Filters, date ranges, and parameters.** List every interactive control you can identify: date-range pickers, dropdown filters, input boxes, optional metric selectors, and data-source switches. State the default date range if it is visible. If a control's options are visible in the HTML, summarize what it filters by.
+4. **Visualizations used.** Enumerate the chart types (time series, bar, stacked bar, pie/donut, geo map, pivot table, plain table, scorecard, gauge, treemap, scatter, funnel) and tie each to the data it presents. Mention tables' key columns and any conditional formatting, sparklines, or heatmap shading.
+5. **Audience and decisions.** Say who would plausibly consult this report (e.g. marketing managers, executives, SDR team leads, finance controllers) and for which recurring decisions or reviews (weekly pacing, budget allocation, campaign optimization, capacity planning). Ground this in the granularity and cadence of the data shown.
+6. **Notable features or sections.** Describe the page's visual organization (header KPIs, left-hand filter rail, sections separated by headings), any embedded text/annotations the author added, drill-downs, links out to other tools, and branding that identifies the owning team or client.
+
+## Additional requirements for multi-page reports
+
+- Summarize each page in its own short paragraph or bullet: what the page contains and its role in the overall report.
+- Describe how the pages relate to one another and the narrative flow (e.g. overview first, then channel detail, then raw data appendix).
+- Point out metrics or filters that recur across pages versus ones unique to a single page, and whether pages share a common date-range control.
+
+## Looker Studio component reference
+
+Use the correct names for what you see so descriptions are consistent across the catalog:
+
+- **Scorecard:** a large single value, optionally with a comparison delta and sparkline. Usually arranged in a row near the top of a page.
+- **Time series chart:** one or more metrics plotted against a date dimension; may have a secondary axis. Note the date granularity (daily, weekly, monthly) if legible.
+- **Bar/column chart:** categorical comparison; note whether it is stacked, grouped, or 100% stacked, and what the bars are sorted by.
+- **Pie/donut chart:** share-of-total breakdown; name the dimension being split.
+- **Table:** rows of dimension values with metric columns; note pagination, sort order, totals rows, and heatmap or bar conditional formatting in cells.
+- **Pivot table:** a table with both row and column dimensions; call out what is being cross-tabulated.
+- **Geo map:** values encoded by region; name the geographic level (country, region, city) if determinable.
+- **Filter control / drop-down:** interactive selector bound to one or more charts; distinguish these from static labels.
+- **Date range control:** the picker governing the reporting window; usually top-right. Report the default window if shown (e.g. "Last 28 days").
+- **Text and image components:** author-added titles, explanations, logos, and dividers; these often reveal the report's intended audience and owner.
+
+## Handling edge cases
+
+- If a chart area shows an error state ("No data", "Configuration error", a broken-image placeholder, or an access-denied message), mention that the component failed to render rather than guessing at its content.
+- If the page appears to be a login wall, consent screen, or an entirely blank canvas, state plainly that the capture does not show report content and describe whatever is identifiable instead of inventing a dashboard.
+- If the HTML is truncated mid-component, rely on the screenshot for anything past the truncation point and do not enumerate half-parsed labels.
+- If two components visibly duplicate each other (common during report edits), describe the content once and note the duplication only if it is prominent.
+- Charts still animating or partially painted in the screenshot should be described by their axis labels and legend text from the HTML rather than their incomplete visual state.
+
+## Output structure
+
+Organize the description with these section headings, in this order, using Markdown `##` headings: "Purpose", "Key metrics", "Filters and parameters", "Visualizations", "Audience and use", and "Notable features". For multi-page reports insert a "Pages" section after "Purpose" containing the per-page summaries. Do not add an overall title heading - the catalog supplies the report name - and do not wrap the output in code fences.
+
+## Style and accuracy rules
+
+- Write in clear, professional prose suitable for documentation. Use short paragraphs and bulleted lists for enumerations; do not use tables.
+- Never invent metric values, date ranges, or filter names that are not visible in the inputs. If something is ambiguous or cut off, either omit it or mark it as uncertain ("appears to show...").
+- Do not mention screenshots, HTML, truncation, this prompt, or the analysis process in the output - describe the report as a reader of the report would experience it.
+- Do not speculate about the underlying data sources unless a connector or source name is visibly displayed.
+- Keep the full description focused and readable: typically 200-500 words for a single-page report, proportionally longer for multi-page reports.
+"""
+
+GEMINI_PROMPT_SINGLE = """**Report Name:** {name}
 
 **Initial Description:** {description}
 
 **Page HTML:** (provided below)
 
 **Screenshot:** (provided as image)
-
-Please provide a comprehensive description that includes:
-1. The purpose and main function of this report
-2. Key metrics, KPIs, or data points displayed
-3. Any filters, date ranges, or parameters visible
-4. The types of visualizations used (charts, tables, etc.)
-5. Who would likely use this report and for what decisions
-6. Any notable features or sections of the dashboard
-
-Write the description in clear, professional language suitable for documentation.
 """
 
-GEMINI_PROMPT_MULTI = """You are analyzing a multi-page Looker Studio dashboard/report. Based on the provided information, write a detailed description covering ALL pages of this report.
+GEMINI_PROMPT_MULTI = """This is a multi-page report. Cover ALL pages in your description.
 
 **Report Name:** {name}
 
@@ -78,39 +180,259 @@ GEMINI_PROMPT_MULTI = """You are analyzing a multi-page Looker Studio dashboard/
 **Page HTML:** (provided below for each page)
 
 **Screenshots:** (provided as images for each page)
+"""
 
-Please provide a comprehensive description that includes:
-1. The overall purpose and main function of this report
-2. A summary of what each page contains and its role in the overall report
-3. Key metrics, KPIs, or data points displayed across all pages
-4. Any filters, date ranges, or parameters visible
-5. The types of visualizations used (charts, tables, etc.)
-6. Who would likely use this report and for what decisions
-7. How the pages relate to each other and the overall narrative/flow
 
-Write the description in clear, professional language suitable for documentation.
-"""
+def retry_on_transient_errors(func):
+    """Retry a blocking call on transient Vertex errors (429/503/timeout).
+
+    Uses exponential backoff with full jitter so a flaky RPC doesn't throw
+    away the full capture cost of a report, and concurrent retries don't
+    thunder back in lockstep.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        for attempt in range(1, MAX_GEMINI_TRIES + 1):
+            try:
+                return func(*args, **kwargs)
+            except RETRYABLE_VERTEX_ERRORS as e:
+                if attempt == MAX_GEMINI_TRIES:
+                    raise
+                delay = random.uniform(0, min(2 ** attempt, 60))
+                print(
+                    f"  Transient Vertex error ({e.__class__.__name__}), "
+                    f"retrying in {delay:.1f}s (attempt {attempt}/{MAX_GEMINI_TRIES})"
+                )
+                time.sleep(delay)
+    return wrapper
+
+
+@functools.lru_cache(maxsize=1)
+def _get_tokenizer():
+    """Return a local tokenizer for the model, or None if unavailable.
+
+    The SDK's supported-model list can lag behind preview releases, but all
+    Gemini generations share the same SentencePiece vocabulary, so an older
+    model's tokenizer still counts our tokens accurately - fall back through
+    known-supported names before giving up.
+    """
+    try:
+        from vertexai.preview import tokenization
+    except ImportError as e:
+        print(f"Warning: local tokenizer unavailable ({e}), using char budget")
+        return None
+
+    for model_name in (GEMINI_MODEL_NAME, "gemini-2.0-flash", "gemini-1.5-flash"):
+        try:
+            return tokenization.get_tokenizer_for_model(model_name)
+        except Exception:
+            continue
+
+    print("Warning: no local tokenizer for any known model, using char budget")
+    return None
+
+
+def truncate_html_to_tokens(html: str, max_tokens: int) -> str:
+    """Truncate HTML to fit a token budget.
+
+    Char counts are a rough proxy for tokens - 50k chars of markup can be
+    anywhere from 8k to 20k tokens - so fit the slice against the real
+    tokenizer via binary search. Falls back to the char cap when no local
+    tokenizer exists for the model.
+    """
+    tokenizer = _get_tokenizer()
+    if tokenizer is None:
+        # Scale the char cap with the budget (~4 chars/token) so multi-page
+        # reports still split the overall budget rather than getting the
+        # full cap per page
+        max_chars = min(MAX_HTML_CHARS, max_tokens * 4)
+        if len(html) > max_chars:
+            return html[:max_chars] + " ... [HTML truncated]"
+        return html
+
+    if tokenizer.count_tokens(html).total_tokens <= max_tokens:
+        return html
+
+    # Binary search the largest prefix within budget
+    lo, hi = 0, len(html)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if tokenizer.count_tokens(html[:mid]).total_tokens <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    return html[:lo] + " ... [HTML truncated]"
+
+
+# Maps filesystem-unsafe characters and whitespace to underscores in one pass
+_FILENAME_TRANS = str.maketrans({c: "_" for c in '<>:"/\\|?*\t\n\r\x0b\x0c '})
 
 
+@functools.lru_cache(maxsize=1024)
 def sanitize_filename(name: str) -> str:
     """Convert report name to safe filename."""
-    safe = re.sub(r'[<>:"/\\|?*]', '_', name)
-    safe = re.sub(r'\s+', '_', safe)
-    safe = safe.strip('_')
-    return safe[:100]
+    safe = re.sub(r'_+', '_', name.translate(_FILENAME_TRANS))
+    return safe.strip('_')[:100]
+
+
+def compute_cache_key(url: str, captures: List["PageCapture"]) -> str:
+    """Build a stable cache key from the report URL and captured content.
+
+    Unchanged dashboards produce identical HTML and screenshot bytes, so
+    reruns hit the cache and skip the Gemini call entirely.
+    """
+    h = hashlib.sha256(url.encode("utf-8"))
+    for capture in captures:
+        h.update(hashlib.sha256(capture.html_content.encode("utf-8")).digest())
+        h.update(hashlib.sha256(capture.screenshot_path.read_bytes()).digest())
+    return h.hexdigest()
 
 
-async def extract_body_html(page) -> str:
-    """Extract only body innerHTML, excluding scripts, styles, and noscript tags."""
+def load_cached_description(key: str) -> Optional[str]:
+    """Return a previously generated description for this key, if any."""
+    cache_file = CACHE_DIR / f"{key}.txt"
+    if cache_file.exists():
+        return cache_file.read_text(encoding="utf-8")
+    return None
+
+
+def store_cached_description(key: str, url: str, name: str, text: str):
+    """Persist a generated description plus sidecar metadata for invalidation."""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    (CACHE_DIR / f"{key}.txt").write_text(text, encoding="utf-8")
+    meta = {"url": url, "name": name}
+    (CACHE_DIR / f"{key}.meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+
+async def extract_body_html(page, max_chars: int = MAX_HTML_CHARS) -> str:
+    """Extract cleaned, truncated body innerHTML.
+
+    Scripts, styles, heavy data-URI/vector attributes, and redundant
+    whitespace are stripped in the browser, and the result is truncated
+    there too, so only the slice we will actually prompt with crosses the
+    CDP wire instead of the full multi-megabyte DOM.
+    """
     return await page.evaluate("""
-        () => {
+        (maxChars) => {
             const bodyClone = document.body.cloneNode(true);
             bodyClone.querySelectorAll('script').forEach(el => el.remove());
             bodyClone.querySelectorAll('style').forEach(el => el.remove());
             bodyClone.querySelectorAll('noscript').forEach(el => el.remove());
-            return bodyClone.innerHTML;
+            // Drop payload-heavy attributes that carry no meaning for the LLM
+            bodyClone.querySelectorAll('img[src^="data:"]').forEach(el => el.removeAttribute('src'));
+            bodyClone.querySelectorAll('path').forEach(el => el.removeAttribute('d'));
+            const html = bodyClone.innerHTML.replace(/\\s+/g, ' ');
+            if (html.length > maxChars) {
+                return html.slice(0, maxChars) + ' ... [HTML truncated]';
+            }
+            return html;
         }
-    """)
+    """, max_chars)
+
+
+def shrink_screenshot(path: Path):
+    """Downscale an oversized screenshot in place to cap the Gemini payload.
+
+    Very tall full-page captures can run to many megabytes; bounding the
+    dimensions keeps upload time and image-token cost down without hurting
+    description quality for text/layout content.
+    """
+    with PILImage.open(path) as im:
+        if im.width <= SCREENSHOT_MAX_SIZE[0] and im.height <= SCREENSHOT_MAX_SIZE[1]:
+            return
+        im.thumbnail(SCREENSHOT_MAX_SIZE, PILImage.LANCZOS)
+        im.save(path, "JPEG", quality=SCREENSHOT_QUALITY, optimize=True)
+
+
+async def block_third_party_requests(context):
+    """Abort analytics/ads/font requests so dashboards reach ready state faster."""
+    async def handle_route(route):
+        if any(part in route.request.url for part in BLOCKED_URL_PARTS):
+            await route.abort()
+        else:
+            await route.continue_()
+
+    await context.route("**/*", handle_route)
+
+
+def tile_screenshots(captures: List["PageCapture"], out_path: Path) -> List[str]:
+    """Tile per-page screenshots into one mosaic image saved at out_path.
+
+    Vertex bills per image, so one tiled upload is much cheaper than N
+    separate ones for reports with many pages. Returns legend lines telling
+    the model where each page sits in the grid.
+    """
+    cols = math.ceil(math.sqrt(len(captures)))
+    rows = math.ceil(len(captures) / cols)
+    tile_width = MOSAIC_WIDTH // cols
+
+    tiles = []
+    for capture in captures:
+        im = PILImage.open(capture.screenshot_path).convert("RGB")
+        scale = tile_width / im.width
+        im = im.resize(
+            (tile_width, max(1, round(im.height * scale))),
+            PILImage.LANCZOS
+        )
+        tiles.append(im)
+
+    row_heights = [
+        max(t.height for t in tiles[r * cols:(r + 1) * cols])
+        for r in range(rows)
+    ]
+
+    mosaic = PILImage.new("RGB", (tile_width * cols, sum(row_heights)), "white")
+    legend = []
+    y = 0
+    for r in range(rows):
+        for c in range(cols):
+            idx = r * cols + c
+            if idx >= len(tiles):
+                break
+            mosaic.paste(tiles[idx], (c * tile_width, y))
+            legend.append(
+                f"Page {captures[idx].page_number} ({captures[idx].page_name}): "
+                f"row {r + 1}, column {c + 1}"
+            )
+        y += row_heights[r]
+
+    mosaic.save(out_path, "JPEG", quality=SCREENSHOT_QUALITY, optimize=True)
+    for tile in tiles:
+        tile.close()
+    mosaic.close()
+    return legend
+
+
+async def capture_full_page_screenshot(page, screenshot_path: Path):
+    """Capture a full-page JPEG screenshot via a direct CDP command.
+
+    Playwright's page.screenshot stitches tall pages tile by tile with extra
+    round-trips; Page.captureScreenshot with captureBeyondViewport grabs the
+    whole surface as JPEG in one CDP message.
+    """
+    try:
+        cdp = await page.context.new_cdp_session(page)
+        try:
+            result = await cdp.send("Page.captureScreenshot", {
+                "format": "jpeg",
+                "quality": SCREENSHOT_QUALITY,
+                "captureBeyondViewport": True,
+                "fromSurface": True,
+            })
+            await asyncio.to_thread(
+                screenshot_path.write_bytes, base64.b64decode(result["data"])
+            )
+        finally:
+            await cdp.detach()
+    except Exception as e:
+        # Fall back to Playwright's own implementation
+        print(f"    Warning: CDP screenshot failed ({e}), using page.screenshot")
+        await page.screenshot(
+            path=str(screenshot_path),
+            full_page=True,
+            type="jpeg",
+            quality=SCREENSHOT_QUALITY
+        )
 
 
 async def save_auth_state(page, auth_file: str):
@@ -120,112 +442,89 @@ async def save_auth_state(page, auth_file: str):
 
 
 async def wait_for_looker_studio_load(page, timeout: int = DEFAULT_TIMEOUT):
-    """Wait for Looker Studio dashboard to finish loading."""
-    try:
-        await page.wait_for_load_state("networkidle", timeout=timeout)
-
-        # Looker Studio specific loading selectors
-        loading_selectors = [
-            "[data-loading='true']",
-            ".loading-spinner",
-            "[data-testid='loading']",
-            "[aria-busy='true']",
-            ".lsapp-loading-indicator",
-            "[class*='loading']",
-        ]
+    """Wait for Looker Studio dashboard to finish loading.
 
-        for selector in loading_selectors:
-            try:
-                await page.wait_for_selector(
-                    selector,
-                    state="hidden",
-                    timeout=5000
-                )
-            except:
-                pass
+    Looker Studio long-polls, so networkidle may never fire; instead poll
+    until the number of rendered chart elements is stable between two
+    samples, which tracks actual render progress rather than fixed timeouts.
+    """
+    try:
+        await page.wait_for_function(
+            """() => {
+                const n = document.querySelectorAll("[data-testid*='chart'], canvas, svg").length;
+                const stable = n === window.__lookerChartCount;
+                window.__lookerChartCount = n;
+                // A stable count of zero just means the app shell hasn't
+                // rendered yet - keep waiting (the timeout still bounds
+                // pages that genuinely have no chart elements)
+                if (n === 0) return false;
+                return stable;
+            }""",
+            polling=500,
+            timeout=min(timeout, 30000)
+        )
 
-        await asyncio.sleep(2)
+        # Brief settle for in-flight paint work
+        await asyncio.sleep(0.5)
 
     except Exception as e:
         print(f"Warning: Page load wait encountered issue: {e}")
 
 
+# Selector strategies for finding page navigation, in priority order:
+# tab navigation, then the page sidebar, then any page-ish buttons
+PAGE_NAV_SELECTORS = [
+    '[role="tablist"] [role="tab"]',
+    '[data-testid="page-tab"]',
+    '.page-tab',
+    'nav [role="button"]',
+    '[class*="page-nav"] [role="button"]',
+    '[class*="page-list"] [role="button"]',
+    '[data-testid="page-navigator"] [role="button"]',
+    '[class*="page"][role="button"], [class*="Page"][role="button"]',
+]
+
+
 async def detect_report_pages(page) -> List[dict]:
-    """Detect multi-page reports using multiple selector strategies.
+    """Detect multi-page reports in a single browser round-trip.
+
+    All selector strategies are tried inside one page.evaluate, which also
+    collects the page names, so detection costs one CDP call instead of one
+    per selector plus one per element.
 
-    Returns list of page info dicts with 'name' and 'selector' keys,
-    or empty list for single-page reports.
+    Returns list of page info dicts with 'name', 'selector' and 'index'
+    keys, or empty list for single-page reports.
     """
-    pages = []
+    result = await page.evaluate("""
+        (selectors) => {
+            for (const sel of selectors) {
+                let els;
+                try {
+                    els = document.querySelectorAll(sel);
+                } catch (e) {
+                    continue;
+                }
+                if (els.length > 1) {
+                    return {
+                        selector: sel,
+                        names: [...els].map(
+                            (el, i) => (el.innerText || '').trim() || `Page ${i + 1}`
+                        )
+                    };
+                }
+            }
+            return null;
+        }
+    """, PAGE_NAV_SELECTORS)
 
-    # Strategy 1: Tab navigation (common in Looker Studio)
-    tab_selectors = [
-        '[role="tablist"] [role="tab"]',
-        '[data-testid="page-tab"]',
-        '.page-tab',
-    ]
+    if not result:
+        return []
 
-    for selector in tab_selectors:
-        try:
-            tabs = await page.query_selector_all(selector)
-            if len(tabs) > 1:
-                for i, tab in enumerate(tabs):
-                    name = await tab.inner_text()
-                    name = name.strip() if name else f"Page {i + 1}"
-                    pages.append({
-                        "name": name,
-                        "selector": selector,
-                        "index": i
-                    })
-                if pages:
-                    return pages
-        except:
-            pass
-
-    # Strategy 2: Page navigation sidebar
-    nav_selectors = [
-        'nav [role="button"]',
-        '[class*="page-nav"] [role="button"]',
-        '[class*="page-list"] [role="button"]',
-        '[data-testid="page-navigator"] [role="button"]',
+    return [
+        {"name": name, "selector": result["selector"], "index": i}
+        for i, name in enumerate(result["names"])
     ]
 
-    for selector in nav_selectors:
-        try:
-            buttons = await page.query_selector_all(selector)
-            if len(buttons) > 1:
-                for i, btn in enumerate(buttons):
-                    name = await btn.inner_text()
-                    name = name.strip() if name else f"Page {i + 1}"
-                    pages.append({
-                        "name": name,
-                        "selector": selector,
-                        "index": i
-                    })
-                if pages:
-                    return pages
-        except:
-            pass
-
-    # Strategy 3: Look for any element with "page" in class containing multiple items
-    try:
-        page_elements = await page.query_selector_all('[class*="page"][role="button"], [class*="Page"][role="button"]')
-        if len(page_elements) > 1:
-            for i, el in enumerate(page_elements):
-                name = await el.inner_text()
-                name = name.strip() if name else f"Page {i + 1}"
-                pages.append({
-                    "name": name,
-                    "element": el,
-                    "index": i
-                })
-            if pages:
-                return pages
-    except:
-        pass
-
-    return pages
-
 
 async def navigate_to_page(page, page_info: dict) -> bool:
     """Click on page navigation element and wait for load.
@@ -233,16 +532,12 @@ async def navigate_to_page(page, page_info: dict) -> bool:
     Returns True if navigation succeeded, False otherwise.
     """
     try:
-        if "element" in page_info:
-            # Direct element reference
-            await page_info["element"].click()
+        # Re-query by selector + index; element handles from detection may be stale
+        elements = await page.query_selector_all(page_info["selector"])
+        if page_info["index"] < len(elements):
+            await elements[page_info["index"]].click()
         else:
-            # Use selector + index
-            elements = await page.query_selector_all(page_info["selector"])
-            if page_info["index"] < len(elements):
-                await elements[page_info["index"]].click()
-            else:
-                return False
+            return False
 
         # Wait for page content to update
         await asyncio.sleep(1)
@@ -268,14 +563,16 @@ async def capture_single_page(
     else:
         file_base = safe_name
 
-    # Capture screenshot
-    screenshot_path = output_path / f"{file_base}.png"
-    await page.screenshot(path=str(screenshot_path), full_page=True)
+    # Capture screenshot as JPEG - 5-10x smaller than lossless PNG for
+    # dashboard content, with no practical quality loss for Gemini
+    screenshot_path = output_path / f"{file_base}.jpg"
+    await capture_full_page_screenshot(page, screenshot_path)
+    await asyncio.to_thread(shrink_screenshot, screenshot_path)
 
     # Extract clean body HTML
     html_content = await extract_body_html(page)
     html_path = output_path / f"{file_base}.html"
-    html_path.write_text(html_content, encoding="utf-8")
+    await asyncio.to_thread(html_path.write_text, html_content, encoding="utf-8")
 
     return PageCapture(
         page_number=page_number,
@@ -289,7 +586,16 @@ async def capture_single_page(
 async def capture_report(page, url: str, output_path: Path, name: str) -> List[PageCapture]:
     """Navigate to report and capture screenshot + HTML for all pages."""
     print(f"  Navigating to: {url}")
-    await page.goto(url, wait_until="domcontentloaded")
+    for attempt in range(1, MAX_GOTO_TRIES + 1):
+        try:
+            await page.goto(url, wait_until="domcontentloaded")
+            break
+        except Exception as e:
+            if attempt == MAX_GOTO_TRIES:
+                raise
+            delay = random.uniform(0, 2 ** attempt)
+            print(f"  Navigation failed ({e}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
 
     print("  Waiting for dashboard to load...")
     await wait_for_looker_studio_load(page)
@@ -340,6 +646,40 @@ async def capture_report(page, url: str, output_path: Path, name: str) -> List[P
     return captures
 
 
+def create_model() -> Tuple[GenerativeModel, Optional[CachedContent]]:
+    """Create the Gemini model, backed by a Vertex context cache when possible.
+
+    The static instruction preamble is registered once as a CachedContent so
+    each generate_content call only pays full token rate for the per-report
+    delta (name/description/HTML/images). Falls back to an uncached model if
+    cache creation fails (e.g. prefix below the minimum cacheable size).
+    """
+    try:
+        cached = CachedContent.create(
+            model_name=GEMINI_MODEL_NAME,
+            system_instruction=GEMINI_SYSTEM_INSTRUCTION,
+            ttl=CACHE_TTL,
+        )
+        return GenerativeModel.from_cached_content(cached), cached
+    except Exception as e:
+        print(f"Warning: context caching unavailable ({e}), using uncached model")
+        model = GenerativeModel(
+            GEMINI_MODEL_NAME,
+            system_instruction=GEMINI_SYSTEM_INSTRUCTION,
+        )
+        return model, None
+
+
+def _image_part(path: Path) -> Part:
+    """Wrap an on-disk JPEG as a request Part without re-decoding it.
+
+    Part.from_data sends the bytes as-is, skipping the decode/re-encode
+    cycle the SDK's Image.load_from_file performs.
+    """
+    return Part.from_data(mime_type="image/jpeg", data=path.read_bytes())
+
+
+@retry_on_transient_errors
 def generate_description(
     name: str,
     initial_description: str,
@@ -359,23 +699,36 @@ def generate_description(
             page_names=page_names
         )
 
-        # Scale HTML limit by page count (50k base, divided among pages)
-        max_html_per_page = 50000 // len(captures)
+        # Token budget divided among pages, so multi-page prompts can't
+        # overshoot the window no matter the page count
+        max_tokens_per_page = MAX_HTML_TOKENS // len(captures)
 
         # Build HTML content for all pages
         html_sections = []
         for capture in captures:
-            html = capture.html_content
-            if len(html) > max_html_per_page:
-                html = html[:max_html_per_page] + "\n... [HTML truncated]"
+            html = truncate_html_to_tokens(capture.html_content, max_tokens_per_page)
             html_sections.append(
                 f"### Page {capture.page_number}: {capture.page_name}\n```html\n{html}\n```"
             )
 
         full_prompt = f"{prompt}\n\n---\n\n**HTML Content:**\n\n" + "\n\n".join(html_sections)
 
-        # Load all images for Vertex AI
-        images = [Image.load_from_file(str(c.screenshot_path)) for c in captures]
+        if len(captures) >= MOSAIC_MIN_PAGES:
+            # Tile all page screenshots into one mosaic - one image upload
+            # instead of N, with a legend mapping grid cells to pages
+            first = captures[0].screenshot_path
+            mosaic_path = first.with_name(
+                first.stem.rsplit("_page", 1)[0] + "_mosaic.jpg"
+            )
+            legend = tile_screenshots(captures, mosaic_path)
+            full_prompt += (
+                "\n\n**Screenshot layout:** All pages are tiled into the single "
+                "image provided, arranged as follows:\n" + "\n".join(legend)
+            )
+            images = [_image_part(mosaic_path)]
+        else:
+            # Few pages: send them individually
+            images = [_image_part(c.screenshot_path) for c in captures]
         content = [full_prompt] + images
     else:
         # Single-page report
@@ -384,16 +737,14 @@ def generate_description(
             description=initial_description
         )
 
-        html_content = captures[0].html_content
-        max_html_chars = 50000
-        if len(html_content) > max_html_chars:
-            html_content = html_content[:max_html_chars] + "\n... [HTML truncated]"
+        # Already cleaned and capped browser-side; fit to the token budget here
+        html_content = truncate_html_to_tokens(
+            captures[0].html_content, MAX_HTML_TOKENS
+        )
 
         full_prompt = f"{prompt}\n\n---\n\n**HTML Content:**\n```html\n{html_content}\n```"
 
-        # Load image for Vertex AI
-        image = Image.load_from_file(str(captures[0].screenshot_path))
-        content = [full_prompt, image]
+        content = [full_prompt, _image_part(captures[0].screenshot_path)]
 
     response = model.generate_content(content)
     return response.text
@@ -422,75 +773,233 @@ async def run_auth_flow(playwright, looker_studio_url: str):
     print("Authentication complete!")
 
 
-async def process_reports(csv_path: str):
+async def process_reports(
+    csv_path: str,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    use_cache: bool = True
+):
     """Main processing function."""
     # Validate configuration
     if not VERTEX_PROJECT_ID:
         print("Error: VERTEX_PROJECT_ID not set. Check your .env file.")
         return
 
-    # Initialize Vertex AI
+    # Initialize Vertex AI. Acquire and refresh ADC credentials explicitly so
+    # every call reuses the same token/channel instead of paying auth setup
+    # inside the first report.
     print(f"Initializing Vertex AI (project: {VERTEX_PROJECT_ID}, location: {VERTEX_LOCATION})")
-    vertexai.init(project=VERTEX_PROJECT_ID, location=VERTEX_LOCATION)
-    model = GenerativeModel("gemini-2.5-flash-preview-05-20")
+    try:
+        credentials, _ = google.auth.default(
+            scopes=["https://www.googleapis.com/auth/cloud-platform"]
+        )
+        credentials.refresh(google.auth.transport.requests.Request())
+    except Exception as e:
+        print(f"Warning: could not pre-refresh credentials ({e})")
+        credentials = None
+    vertexai.init(
+        project=VERTEX_PROJECT_ID,
+        location=VERTEX_LOCATION,
+        credentials=credentials
+    )
+    model, cached_content = create_model()
+
+    # Fire a throwaway request so the first real report doesn't eat the
+    # gRPC channel setup latency
+    try:
+        model.generate_content("ping", generation_config={"max_output_tokens": 1})
+    except Exception as e:
+        print(f"Warning: model warmup failed: {e}")
 
     output_path = Path(OUTPUT_DIR)
     output_path.mkdir(exist_ok=True)
 
-    reports = []
-    with open(csv_path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            reports.append({
-                "name": row.get("name", "").strip(),
-                "url": row.get("url", "").strip(),
-                "description": row.get("description", "").strip()
-            })
-
-    print(f"Found {len(reports)} reports to process")
+    # Rows stream straight from the CSV into the capture pipeline, so work
+    # starts on the first row while the rest of the file is still parsing
+    report_queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    async def read_reports():
+        """Stream CSV rows into the report queue while the browser spins up."""
+        count = 0
+        with io.open(csv_path, "r", encoding="utf-8", buffering=1 << 20) as f:
+            reader = csv.reader(f)
+            header = next(reader, [])
+            columns = {col.strip().lower(): i for i, col in enumerate(header)}
+
+            def field(row, col):
+                i = columns.get(col)
+                return row[i].strip() if i is not None and i < len(row) else ""
+
+            for row in reader:
+                count += 1
+                await report_queue.put((count, {
+                    "name": field(row, "name"),
+                    "url": field(row, "url"),
+                    "description": field(row, "description")
+                }))
+
+        print(f"Queued {count} reports from {csv_path}")
+        # One sentinel per capture worker
+        for _ in range(concurrency):
+            await report_queue.put(None)
 
     async with async_playwright() as playwright:
         if not Path(AUTH_STATE_FILE).exists():
             await run_auth_flow(playwright, LOOKER_STUDIO_URL)
 
-        browser = await playwright.chromium.launch(headless=True)
-        context = await browser.new_context(storage_state=AUTH_STATE_FILE)
-        page = await context.new_page()
+        # Start parsing rows while Chromium launches
+        reader_task = asyncio.create_task(read_reports())
+
+        # One shared browser, one isolated context per report. Contexts are
+        # cheap, so a bounded pool of concurrent captures gives near-linear
+        # speedup on the I/O-bound capture phase. The disk cache is pointed
+        # at a persistent directory so Looker Studio's JS bundles and assets
+        # stay cached across contexts and across CLI runs.
+        browser = await playwright.chromium.launch(
+            headless=True,
+            args=[f"--disk-cache-dir={Path(BROWSER_CACHE_DIR).resolve()}"]
+        )
 
-        for i, report in enumerate(reports, 1):
+        # Captures feed a bounded queue; a worker pool drains it and runs the
+        # blocking Gemini RPC in threads, so LLM latency overlaps with the
+        # browser capturing the next report instead of leaving it idle.
+        describe_queue: asyncio.Queue = asyncio.Queue(maxsize=DESCRIBE_QUEUE_SIZE)
+
+        # The same URL can appear on several CSV rows (shared dashboards):
+        # capture/describe it once and fan the result out to the other rows
+        primary_desc_paths: dict = {}
+        duplicate_rows: dict = {}
+
+        async def capture_one(i: int, report: dict):
             name = report["name"]
             url = report["url"]
             description = report["description"]
 
-            print(f"\n[{i}/{len(reports)}] Processing: {name}")
-
             if not url:
-                print("  Skipping - no URL provided")
-                continue
+                print(f"[{i}] Skipping {name} - no URL provided")
+                return
+
+            # Registration happens before the first await, so concurrent
+            # workers can't both claim the same URL
+            if url in primary_desc_paths:
+                duplicate_rows.setdefault(url, []).append(report)
+                print(f"[{i}] Duplicate URL for {name} - will reuse its description")
+                return
+            primary_desc_paths[url] = output_path / f"{sanitize_filename(name)}.txt"
+
+            print(f"\n[{i}] Processing: {name}")
+            context = await browser.new_context(storage_state=AUTH_STATE_FILE)
+            await block_third_party_requests(context)
+            page = await context.new_page()
 
             try:
                 captures = await capture_report(page, url, output_path, name)
-
-                if not captures:
-                    print("  No pages captured, skipping")
-                    continue
-
-                print("  Generating description with Gemini...")
-                detailed_description = generate_description(
-                    name, description, captures, model
+            except Exception as e:
+                print(f"  ERROR capturing {name}: {e}")
+                return
+            finally:
+                await context.close()
+
+            if not captures:
+                print("  No pages captured, skipping")
+                return
+
+            # Skip the Gemini call entirely if we've already described
+            # identical content for this URL
+            cache_key = (
+                await asyncio.to_thread(compute_cache_key, url, captures)
+                if use_cache else None
+            )
+            if cache_key:
+                cached_text = await asyncio.to_thread(
+                    load_cached_description, cache_key
                 )
+                if cached_text is not None:
+                    safe_name = sanitize_filename(name)
+                    desc_path = output_path / f"{safe_name}.txt"
+                    await asyncio.to_thread(
+                        desc_path.write_text, cached_text, encoding="utf-8"
+                    )
+                    print(f"  Description restored from cache: {desc_path}")
+                    return
+
+            await describe_queue.put((name, url, description, captures, cache_key))
+
+        async def describe_worker():
+            while True:
+                item = await describe_queue.get()
+                if item is None:
+                    return
+                name, url, description, captures, cache_key = item
+
+                try:
+                    print(f"  Generating description with Gemini: {name}")
+                    detailed_description = await asyncio.to_thread(
+                        generate_description, name, description, captures, model
+                    )
+
+                    safe_name = sanitize_filename(name)
+                    desc_path = output_path / f"{safe_name}.txt"
+                    await asyncio.to_thread(
+                        desc_path.write_text, detailed_description, encoding="utf-8"
+                    )
+                    print(f"  Description saved: {desc_path}")
+
+                    if cache_key:
+                        await asyncio.to_thread(
+                            store_cached_description,
+                            cache_key, url, name, detailed_description
+                        )
+                except Exception as e:
+                    print(f"  ERROR describing {name}: {e}")
+
+        async def capture_worker():
+            while True:
+                item = await report_queue.get()
+                if item is None:
+                    return
+                i, report = item
+                await capture_one(i, report)
+
+        workers = [
+            asyncio.create_task(describe_worker())
+            for _ in range(DESCRIBE_WORKERS)
+        ]
+        capture_workers = [
+            asyncio.create_task(capture_worker())
+            for _ in range(concurrency)
+        ]
 
-                safe_name = sanitize_filename(name)
-                desc_path = output_path / f"{safe_name}.txt"
-                desc_path.write_text(detailed_description, encoding="utf-8")
-                print(f"  Description saved: {desc_path}")
+        await reader_task
+        await asyncio.gather(*capture_workers)
 
-            except Exception as e:
-                print(f"  ERROR: {e}")
+        # All captures queued; signal workers to drain and exit
+        for _ in workers:
+            await describe_queue.put(None)
+        await asyncio.gather(*workers)
+
+        # Fan descriptions out to duplicate rows of the same URL
+        for url, rows in duplicate_rows.items():
+            src = primary_desc_paths.get(url)
+            if src is None or not src.exists():
                 continue
+            text = await asyncio.to_thread(src.read_text, encoding="utf-8")
+            for row in rows:
+                dup_path = output_path / f"{sanitize_filename(row['name'])}.txt"
+                if dup_path == src:
+                    continue
+                await asyncio.to_thread(dup_path.write_text, text, encoding="utf-8")
+                print(f"  Description copied for duplicate URL: {dup_path}")
 
         await browser.close()
 
+    # Drop the context cache so it stops accruing storage cost. If we crash
+    # before reaching this, the TTL expires it anyway.
+    if cached_content:
+        try:
+            cached_content.delete()
+        except Exception as e:
+            print(f"Warning: failed to delete context cache: {e}")
+
     print(f"\n=== Complete! Output saved to {OUTPUT_DIR}/ ===")
 
 
@@ -507,6 +1016,17 @@ def main():
         action="store_true",
         help="Force re-authentication even if auth state exists"
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"Number of reports to capture in parallel (default: {DEFAULT_CONCURRENCY})"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always call Gemini, even if a cached description exists for unchanged content"
+    )
 
     args = parser.parse_args()
 
@@ -514,7 +1034,11 @@ def main():
         Path(AUTH_STATE_FILE).unlink()
         print("Removed existing auth state")
 
-    asyncio.run(process_reports(args.csv_file))
+    asyncio.run(process_reports(
+        args.csv_file,
+        concurrency=args.concurrency,
+        use_cache=not args.no_cache
+    ))
     return 0
 
 